@@ -1,107 +1,40 @@
 from __future__ import annotations
 
 import json
-import uuid
-from dataclasses import dataclass, asdict
-from datetime import datetime, timedelta, date
-from zoneinfo import ZoneInfo
-from typing import List, Optional
+from dataclasses import asdict
+from datetime import datetime
+from typing import List
 
 import streamlit as st
-from lunardate import LunarDate
 
-TZ = ZoneInfo("Asia/Taipei")
-
-
-@dataclass
-class LunarEvent:
-    title: str = "事件"
-    lunar_month: int = 1
-    lunar_day: int = 1
-    is_leap_month: bool = False
-    time: str = "09:00"               # HH:MM
-    duration_minutes: int = 30
-    alarm_minutes_before: Optional[int] = 1440  # None = no alarm
-    notes: str = ""
-
-
-def parse_time_hm(hm: str) -> tuple[int, int]:
-    parts = hm.strip().split(":")
-    if len(parts) != 2:
-        raise ValueError("時間格式需為 HH:MM，例如 09:00")
-    h, m = int(parts[0]), int(parts[1])
-    if not (0 <= h <= 23 and 0 <= m <= 59):
-        raise ValueError("時間需在 00:00 ~ 23:59")
-    return h, m
-
-
-def ics_escape(s: str) -> str:
-    return (s or "").replace("\\", "\\\\").replace("\n", "\\n").replace(",", "\\,").replace(";", "\\;")
-
-
-def dtstamp_utc() -> str:
-    return datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-
-
-def format_dt_local(dt: datetime) -> str:
-    return dt.strftime("%Y%m%dT%H%M%S")
-
-
-def lunar_to_solar_date(greg_year: int, lunar_month: int, lunar_day: int, is_leap_month: bool) -> date:
-    return LunarDate(greg_year, lunar_month, lunar_day, is_leap_month).toSolarDate()
-
-
-def build_ics(events: List[LunarEvent], start_year: int, years: int, calendar_name: str = "農曆提醒") -> str:
-    lines: list[str] = []
-    lines.append("BEGIN:VCALENDAR")
-    lines.append("VERSION:2.0")
-    lines.append("PRODID:-//Lunar ICS Generator//Dennis//ZH-TW")
-    lines.append("CALSCALE:GREGORIAN")
-    lines.append("METHOD:PUBLISH")
-    lines.append(f"X-WR-CALNAME:{ics_escape(calendar_name)}")
-    lines.append("X-WR-TIMEZONE:Asia/Taipei")
-
-    for ev in events:
-        h, m = parse_time_hm(ev.time)
-        for y in range(start_year, start_year + years):
-            try:
-
-                solar = lunar_to_solar_date(y, ev.lunar_month, ev.lunar_day, ev.is_leap_month)
+try:
+    import orjson
+except ImportError:  # orjson 為選用套件，沒有安裝時改用標準庫 json
+    orjson = None
 
-            except Exception:
+from lunar_core import DEFAULT_EVENTS, TZ, LunarEvent, build_ics_bytes, lunar_to_solar_date, normalize_event
 
-                # 某些年份不存在此閏月（或日期無效）→ 跳過該年份
 
-                continue
-            start_dt = datetime(solar.year, solar.month, solar.day, h, m, 0, tzinfo=TZ)
-            end_dt = start_dt + timedelta(minutes=ev.duration_minutes)
+@st.cache_data(show_spinner=False, ttl=24 * 60 * 60, max_entries=32)
+def build_ics_bytes_cached(events: List[dict], start_year: int, years: int, calendar_name: str = "農曆提醒") -> bytes:
+    # Streamlit 每次互動都會重跑整個腳本；事項沒變時直接沿用上次產生的 .ics
+    return build_ics_bytes(events, start_year, years, calendar_name)
 
-            lines.append("BEGIN:VEVENT")
-            lines.append(f"UID:{uuid.uuid4()}@lunar-ics")
-            lines.append(f"DTSTAMP:{dtstamp_utc()}")
-            lines.append(f"SUMMARY:{ics_escape(ev.title)}")
-            if ev.notes:
-                lines.append(f"DESCRIPTION:{ics_escape(ev.notes)}")
-            lines.append(f"DTSTART;TZID=Asia/Taipei:{format_dt_local(start_dt)}")
-            lines.append(f"DTEND;TZID=Asia/Taipei:{format_dt_local(end_dt)}")
 
-            if ev.alarm_minutes_before is not None:
-                minutes = int(ev.alarm_minutes_before)
-                lines.append("BEGIN:VALARM")
-                lines.append("ACTION:DISPLAY")
-                lines.append(f"DESCRIPTION:{ics_escape(ev.title)}")
-                lines.append(f"TRIGGER:-PT{minutes}M")
-                lines.append("END:VALARM")
+def dumps_events(events: List[dict]) -> bytes:
+    # 備份檔直接產生 UTF-8 bytes 交給下載按鈕
+    if orjson is not None:
+        return orjson.dumps(events, option=orjson.OPT_INDENT_2)
+    return json.dumps(events, ensure_ascii=False, indent=2).encode("utf-8")
 
-            lines.append("END:VEVENT")
 
-    lines.append("END:VCALENDAR")
-    return "\r\n".join(lines) + "\r\n"
+def loads_events(data: bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
 
 
-def apply_css() -> None:
-    st.markdown(
-        """
+APP_CSS = """
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Yuji+Syuku&display=swap');
 
@@ -185,41 +118,43 @@ div.stDownloadButton>button{
   padding: 0.62rem 0.95rem;
 }
 </style>
-""",
-        unsafe_allow_html=True,
-    )
+"""
+
+
+def apply_css() -> None:
+    st.markdown(APP_CSS, unsafe_allow_html=True)
 
 
 def ensure_state() -> None:
+    # 只有第一次執行才建立預設清單；之後的 rerun 只做一次成員檢查
     if "events" not in st.session_state:
-        st.session_state.events = [
-            asdict(LunarEvent(
-                title="媽祖生日",
-                lunar_month=3,
-                lunar_day=23,
-                is_leap_month=False,
-                time="09:00",
-                duration_minutes=30,
-                alarm_minutes_before=1440,
-                notes="準備供品/香燭"
-            ))
-        ]
-
-
-def alarm_default_index(minutes: Optional[int]) -> int:
-    opts = ["無", "當下", "10 分鐘前", "30 分鐘前", "1 小時前", "3 小時前", "1 天前", "2 天前", "自訂(分鐘)"]
-    mapping = {None: 0, 0: 1, 10: 2, 30: 3, 60: 4, 180: 5, 1440: 6, 2880: 7}
-    return mapping.get(minutes, 8)
-
-
-def alarm_label_to_minutes(label: str, current: Optional[int]) -> Optional[int]:
-    mapping = {
-        "無": None, "當下": 0, "10 分鐘前": 10, "30 分鐘前": 30,
-        "1 小時前": 60, "3 小時前": 180, "1 天前": 1440, "2 天前": 2880
+        st.session_state.events = [asdict(ev) for ev in DEFAULT_EVENTS]
+
+
+EVENT_COLUMNS = (
+    "title", "lunar_month", "lunar_day", "is_leap_month",
+    "time", "duration_minutes", "alarm_minutes_before", "notes",
+)
+
+
+# app.py 每次互動都會整份重跑，模組層級的常數也會重建；
+# 欄位設定改用 cache_resource 在整個程序只建一次（data_editor 會自行複製，不會改到它）
+@st.cache_resource
+def event_column_config() -> dict:
+    defaults = LunarEvent()
+    return {
+        "title": st.column_config.TextColumn("名稱", default=defaults.title, required=True),
+        "lunar_month": st.column_config.NumberColumn("農曆月", min_value=1, max_value=12, step=1, default=defaults.lunar_month, required=True),
+        "lunar_day": st.column_config.NumberColumn("農曆日", min_value=1, max_value=30, step=1, default=defaults.lunar_day, required=True),
+        "is_leap_month": st.column_config.CheckboxColumn("閏月", default=defaults.is_leap_month),
+        "time": st.column_config.TextColumn("時間 HH:MM", default=defaults.time, validate=r"^\s*\d{1,2}:\d{2}\s*$", required=True),
+        "duration_minutes": st.column_config.NumberColumn("時長(分)", min_value=1, max_value=1440, step=1, default=defaults.duration_minutes, required=True),
+        "alarm_minutes_before": st.column_config.NumberColumn(
+            "提醒(提前分鐘)", min_value=0, max_value=10080, step=1, format="%d",
+            default=defaults.alarm_minutes_before, help="空白＝不提醒；60＝1 小時前；1440＝1 天前",
+        ),
+        "notes": st.column_config.TextColumn("備註（可空白）", default=defaults.notes),
     }
-    if label in mapping:
-        return mapping[label]
-    return current if current is not None else 60
 
 
 st.set_page_config(page_title="農曆提醒產生器", page_icon="🗓️", layout="wide")
@@ -231,58 +166,42 @@ st.caption("只輸入農曆（月/日/閏月），會顯示起始年對應的國
 
 st.subheader("產生設定")
 st.caption("決定要產生哪些『國曆年份』的事件（例如：2026 起，往後 20 年）。")
-c1, c2, c3 = st.columns([1, 1, 2])
+c1, c2, _ = st.columns([1, 1, 2])
 with c1:
     start_year = st.number_input("起始年（國曆）", min_value=1900, max_value=2200, value=datetime.now(TZ).year, step=1)
 with c2:
     years = st.number_input("往後產生（年）", min_value=1, max_value=60, value=20, step=1)
-with c3:
-    st.write("")
-    st.write("")
-    if st.button("➕ 增加事項", use_container_width=True):
-        st.session_state.events.append(asdict(LunarEvent()))
 
 st.divider()
 st.subheader("事項清單")
 
-for idx, ev in enumerate(list(st.session_state.events)):
-    title = (ev.get("title") or "未命名事項").strip()
-    with st.expander(f"{idx+1}. {title}", expanded=True):
-        ev["title"] = st.text_input("名稱", value=ev.get("title", ""), key=f"title_{idx}")
-
-        d1, d2, d3, d4 = st.columns([1, 1, 1, 2])
-        ev["lunar_month"] = d1.number_input("農曆月", 1, 12, int(ev.get("lunar_month", 1)), 1, key=f"lm_{idx}")
-        ev["lunar_day"] = d2.number_input("農曆日", 1, 30, int(ev.get("lunar_day", 1)), 1, key=f"ld_{idx}")
-        ev["is_leap_month"] = d3.checkbox("閏月", value=bool(ev.get("is_leap_month", False)), key=f"leap_{idx}")
-
-        try:
-            preview = lunar_to_solar_date(int(start_year), int(ev["lunar_month"]), int(ev["lunar_day"]), bool(ev["is_leap_month"]))
-            d4.markdown(f"**{start_year} 年對應國曆：** {preview.isoformat()}")
-        except Exception:
-            d4.markdown("⚠️ 此起始年沒有這個閏月（或日期無效），會自動略過該年份。")
-
-        t1, t2, t3, t4 = st.columns([1, 1, 1, 2])
-        ev["time"] = t1.text_input("時間 HH:MM", value=ev.get("time", "09:00"), key=f"time_{idx}")
-        ev["duration_minutes"] = t2.number_input("時長(分)", 1, 1440, int(ev.get("duration_minutes", 30)), 5, key=f"dur_{idx}")
-
-        alarm_options = ["無", "當下", "10 分鐘前", "30 分鐘前", "1 小時前", "3 小時前", "1 天前", "2 天前", "自訂(分鐘)"]
-        current_alarm = ev.get("alarm_minutes_before", 1440)
-        sel = t3.selectbox("提醒", options=alarm_options, index=alarm_default_index(current_alarm), key=f"alarm_sel_{idx}")
-        if sel == "自訂(分鐘)":
-            ev["alarm_minutes_before"] = int(st.number_input(
-                "自訂提前(分)", 0, 10080, int(current_alarm or 60), 5, key=f"alarm_custom_{idx}"
-            ))
-        else:
-            ev["alarm_minutes_before"] = alarm_label_to_minutes(sel, current_alarm)
-
-        ev["notes"] = t4.text_input("備註（可空白）", value=ev.get("notes", ""), key=f"notes_{idx}")
-
-        if st.button("刪除這筆事項", key=f"del_{idx}"):
-            st.session_state.events.pop(idx)
-            st.rerun()
-
-if not st.session_state.events:
-    st.session_state.events = [asdict(LunarEvent())]
+st.caption("直接在表格中編輯；最下方一列可新增事項，勾選列後按刪除鍵可移除。編輯完按「套用變更」才會更新預覽與 .ics。")
+
+# 整份清單只用一個表格元件；st.session_state.events 保持為編輯的起點，
+# 編輯結果以 events 往下傳給預覽、備份與 .ics
+# 包在 form 裡：表格內的每次修改不會觸發重跑，按下送出才整批套用一次
+with st.form("events_form", clear_on_submit=False, border=False):
+    edited = st.data_editor(
+        st.session_state.events,
+        column_order=EVENT_COLUMNS,
+        column_config=event_column_config(),
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        key="events_editor",
+    )
+    st.form_submit_button("套用變更")
+events = [normalize_event(row) for row in edited]
+
+preview_lines = []
+for idx, ev in enumerate(events):
+    title = ev["title"].strip() or "未命名事項"
+    try:
+        preview = lunar_to_solar_date(start_year, ev["lunar_month"], ev["lunar_day"], ev["is_leap_month"])
+        preview_lines.append(f"{idx+1}. {title}：**{start_year} 年對應國曆** {preview.isoformat()}")
+    except Exception:
+        preview_lines.append(f"{idx+1}. {title}：⚠️ 此起始年沒有這個閏月（或日期無效），會自動略過該年份。")
+st.markdown("\n".join(preview_lines))
 
 st.divider()
 
@@ -290,10 +209,9 @@ with st.expander("📦 備份 / 還原（農曆事項）", expanded=False):
     st.caption("備份檔只包含你設定的農曆事項，不會修改手機行事曆。")
     left, right = st.columns(2)
     with left:
-        export_json = json.dumps(st.session_state.events, ensure_ascii=False, indent=2)
         st.download_button(
             "下載備份檔",
-            data=export_json.encode("utf-8"),
+            data=dumps_events(events),
             file_name="events.json",
             mime="application/json",
             use_container_width=True
@@ -302,10 +220,10 @@ with st.expander("📦 備份 / 還原（農曆事項）", expanded=False):
         up = st.file_uploader("還原備份檔", type=["json"])
         if up is not None:
             try:
-                raw = json.loads(up.getvalue().decode("utf-8"))
+                raw = loads_events(up.getvalue())
                 if not isinstance(raw, list):
                     raise ValueError("備份檔格式錯誤：內容需為陣列（list）")
-                st.session_state.events = raw if raw else [asdict(LunarEvent())]
+                st.session_state.events = [normalize_event(e) for e in raw] or [asdict(LunarEvent())]
                 st.success(f"已還原 {len(st.session_state.events)} 筆事項。")
                 st.rerun()
             except Exception as e:
@@ -316,11 +234,11 @@ st.subheader("下載 .ics")
 st.caption("下載後把檔案傳到 iPhone（AirDrop / iCloud Drive / Email），點開即可加入行事曆。")
 
 try:
-    events_dc = [LunarEvent(**e) for e in st.session_state.events]
-    ics_text = build_ics(events_dc, int(start_year), int(years))
+    # events 已經過 normalize_event 補齊欄位，可直接交給 build_ics
+    ics_bytes = build_ics_bytes_cached(events, start_year, years)
     st.download_button(
         "下載 lunar_events.ics",
-        data=ics_text.encode("utf-8"),
+        data=ics_bytes,
         file_name="lunar_events.ics",
         mime="text/calendar",
         use_container_width=True
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import io
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, timezone, date
+from zoneinfo import ZoneInfo
+from typing import Iterator, List, Optional
+
+import lunardate
+from lunardate import LunarDate
+
+TZ = ZoneInfo("Asia/Taipei")
+
+
+@dataclass(frozen=True, slots=True)
+class LunarEvent:
+    title: str = "事件"
+    lunar_month: int = 1
+    lunar_day: int = 1
+    is_leap_month: bool = False
+    time: str = "09:00"               # HH:MM
+    duration_minutes: int = 30
+    alarm_minutes_before: Optional[int] = 1440  # None = no alarm
+    notes: str = ""
+
+
+# 第一次開啟時的示範事項
+DEFAULT_EVENTS = (
+    LunarEvent(
+        title="媽祖生日",
+        lunar_month=3,
+        lunar_day=23,
+        is_leap_month=False,
+        time="09:00",
+        duration_minutes=30,
+        alarm_minutes_before=1440,
+        notes="準備供品/香燭"
+    ),
+)
+
+
+def is_blank(value) -> bool:
+    # None、float NaN（NaN != NaN），以及無法轉成 bool 的 pandas.NA 都視為空白
+    try:
+        return value is None or bool(value != value)
+    except TypeError:
+        return True
+
+
+def normalize_event(row: dict) -> dict:
+    # 表格編輯或備份還原的資料：缺欄位／空白（None、NaN）補預設值，並統一成 Python 基本型別
+    ev = asdict(LunarEvent())
+    for name, default in ev.items():
+        if name not in row:
+            # 沒有這個欄位（例如舊版備份檔）→ 沿用預設值，提醒也是預設的 1 天前
+            continue
+        value = row[name]
+        if is_blank(value):
+            # 欄位存在但留空：提醒代表不提醒，其餘欄位回到預設值
+            ev[name] = None if name == "alarm_minutes_before" else default
+        elif name in ("lunar_month", "lunar_day", "duration_minutes", "alarm_minutes_before"):
+            ev[name] = int(value)
+        elif name == "is_leap_month":
+            ev[name] = bool(value)
+        else:
+            ev[name] = str(value)
+    return ev
+
+
+def parse_time_hm(hm: str) -> tuple[int, int]:
+    parts = hm.strip().split(":")
+    if len(parts) != 2:
+        raise ValueError("時間格式需為 HH:MM，例如 09:00")
+    h, m = int(parts[0]), int(parts[1])
+    if not (0 <= h <= 23 and 0 <= m <= 59):
+        raise ValueError("時間需在 00:00 ~ 23:59")
+    return h, m
+
+
+ICS_ESCAPE_TABLE = str.maketrans({"\\": "\\\\", "\n": "\\n", ",": "\\,", ";": "\\;"})
+
+
+def ics_escape(s: str) -> str:
+    if not s:
+        return ""
+    # 大多數名稱／備註沒有需要跳脫的字元，直接回傳原字串
+    if "\\" not in s and "\n" not in s and "," not in s and ";" not in s:
+        return s
+    return s.translate(ICS_ESCAPE_TABLE)
+
+
+def fold_line(line: str, limit: int = 75) -> str:
+    # RFC 5545 3.1：每行最多 75 octets，超過的以 CRLF + 空白續行
+    data = line.encode("utf-8")
+    if len(data) <= limit:
+        return line
+    parts = []
+    start = 0
+    width = limit
+    while len(data) - start > width:
+        end = start + width
+        # 不要切在 UTF-8 多位元組字元的中間
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end])
+        start = end
+        width = limit - 1  # 續行開頭的空白也算一個 octet
+    parts.append(data[start:])
+    return b"\r\n ".join(parts).decode("utf-8")
+
+
+def brace_escape(s: str) -> str:
+    # 使用者輸入要放進 str.format 樣板前，先跳脫大括號
+    return s.replace("{", "{{").replace("}", "}}")
+
+
+def dtstamp_utc() -> str:
+    return format_dt_local(datetime.now(timezone.utc)) + "Z"
+
+
+def format_dt_local(dt: datetime) -> str:
+    # 格式固定，直接補零組字串，不經過 strftime 解析格式字串
+    return f"{dt.year:04d}{dt.month:02d}{dt.day:02d}T{dt.hour:02d}{dt.minute:02d}{dt.second:02d}"
+
+
+LUNAR_TABLE_START_YEAR = 1900
+LUNAR_TABLE_FIRST_DAY = date(1900, 1, 31)  # 農曆 1900/1/1
+
+
+def build_lunar_month_table() -> list[dict[tuple[int, bool], tuple[int, int]]]:
+    # 依 lunardate 內建的逐年編碼，預先算出每個農曆月「初一的國曆序數、該月天數」
+    year_infos = getattr(lunardate, "YEAR_INFOS", None) or getattr(lunardate, "yearInfos", None)
+    if not year_infos:
+        return []
+    ordinal = LUNAR_TABLE_FIRST_DAY.toordinal()
+    table: list[dict[tuple[int, bool], tuple[int, int]]] = []
+    for info in year_infos:
+        leap_month = info & 0xF
+        months: dict[tuple[int, bool], tuple[int, int]] = {}
+        for month in range(1, 13):
+            days = 29 + ((info >> (16 - month)) & 1)
+            months[(month, False)] = (ordinal, days)
+            ordinal += days
+            if month == leap_month:
+                days = 29 + ((info >> 16) & 1)
+                months[(month, True)] = (ordinal, days)
+                ordinal += days
+        table.append(months)
+
+    # 編碼格式若與此版 lunardate 不符，就整張表停用，改回逐筆換算
+    # 查核本身出錯（例如編碼涵蓋的年份超出 lunardate 可換算的範圍）也一樣停用
+    last_year = LUNAR_TABLE_START_YEAR + len(table) - 1
+    try:
+        if LunarDate(last_year, 12, 1).toSolarDate().toordinal() != table[-1][(12, False)][0]:
+            return []
+    except Exception:
+        return []
+    return table
+
+
+LUNAR_MONTH_TABLE = build_lunar_month_table()
+
+
+@functools.lru_cache(maxsize=4096)
+def lunar_to_solar_date(greg_year: int, lunar_month: int, lunar_day: int, is_leap_month: bool) -> date:
+    idx = greg_year - LUNAR_TABLE_START_YEAR
+    if 0 <= idx < len(LUNAR_MONTH_TABLE):
+        month = LUNAR_MONTH_TABLE[idx].get((lunar_month, bool(is_leap_month)))
+        if month is None:
+            raise ValueError("month out of range")
+        first_ordinal, days = month
+        if not 1 <= lunar_day <= days:
+            raise ValueError("day out of range")
+        return date.fromordinal(first_ordinal + lunar_day - 1)
+    # 表格範圍外（或表格停用）交回 lunardate 處理／報錯
+    return LunarDate(greg_year, lunar_month, lunar_day, is_leap_month).toSolarDate()
+
+
+@functools.lru_cache(maxsize=None)
+def lunar_date_series(lunar_month: int, lunar_day: int, is_leap_month: bool) -> tuple[Optional[date], ...]:
+    # 同一個農曆日期在月份表涵蓋的每一年（自 1900 年起）對應的國曆；該年沒有這天則為 None。
+    # 第一次用到才建，之後不論起始年／年數怎麼調都只是索引
+    series: list[Optional[date]] = []
+    for months in LUNAR_MONTH_TABLE:
+        month = months.get((lunar_month, is_leap_month))
+        if month is None or not 1 <= lunar_day <= month[1]:
+            series.append(None)
+        else:
+            series.append(date.fromordinal(month[0] + lunar_day - 1))
+    return tuple(series)
+
+
+def lunar_solar_dates(lunar_month: int, lunar_day: int, is_leap_month: bool, start_year: int, years: int) -> tuple[date, ...]:
+    # 月份表內的年份只是索引 lunar_date_series 的快取序列，不需再另外快取整段結果
+    series = lunar_date_series(int(lunar_month), int(lunar_day), bool(is_leap_month))
+    solars: list[date] = []
+    for y in range(start_year, start_year + years):
+        idx = y - LUNAR_TABLE_START_YEAR
+        if 0 <= idx < len(series):
+            solar = series[idx]
+        else:
+            # 月份表範圍外交回 lunar_to_solar_date（lunardate 會判斷是否支援）
+            try:
+                solar = lunar_to_solar_date(y, lunar_month, lunar_day, is_leap_month)
+            except Exception:
+                solar = None
+        # 某些年份不存在此閏月（或日期無效）→ 跳過該年份
+        if solar is not None:
+            solars.append(solar)
+    return tuple(solars)
+
+
+def event_occurrences(ev: dict, start_year: int, years: int) -> list[tuple[str, str, str]]:
+    # 先把每一年的日期計算做完，回傳 (國曆日期, DTSTART, DTEND) 字串；組 VEVENT 文字時不再碰日期運算
+    h, m = parse_time_hm(ev["time"])
+    # 結束時間換算成「跨了幾天 + 當天時分」，每年只需把起始日往後推這幾天
+    days_over, end_min = divmod(h * 60 + m + int(ev["duration_minutes"]), 24 * 60)
+    day_shift = timedelta(days=days_over)
+    eh, em = divmod(end_min, 60)
+    start_hms = f"T{h:02d}{m:02d}00"
+    end_hms = f"T{eh:02d}{em:02d}00"
+
+    occurrences: list[tuple[str, str, str]] = []
+    for solar in lunar_solar_dates(ev["lunar_month"], ev["lunar_day"], ev["is_leap_month"], start_year, years):
+        # DTSTART/DTEND 以 TZID 標示當地時間，不需要帶時區的 datetime 物件
+        ymd = f"{solar.year:04d}{solar.month:02d}{solar.day:02d}"
+        if days_over:
+            end_date = solar + day_shift
+            end_s = f"{end_date.year:04d}{end_date.month:02d}{end_date.day:02d}" + end_hms
+        else:
+            end_s = ymd + end_hms
+        occurrences.append((ymd, ymd + start_hms, end_s))
+    return occurrences
+
+
+def event_uid_key(ev: dict) -> str:
+    # UID 由事項內容決定：同樣的輸入每次產生同樣的 .ics（可被快取），
+    # 重新匯入時行事曆也會更新既有事件，而不是重複新增
+    raw = "\x1f".join((
+        ev["title"] or "",
+        str(int(ev["lunar_month"])),
+        str(int(ev["lunar_day"])),
+        str(int(bool(ev["is_leap_month"]))),
+        ev["time"].strip(),
+    ))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+# 檔頭只有 X-WR-CALNAME 會變，其餘固定的部分在載入時組好
+ICS_HEADER = (
+    "BEGIN:VCALENDAR\r\n"
+    "VERSION:2.0\r\n"
+    "PRODID:-//Lunar ICS Generator//Dennis//ZH-TW\r\n"
+    "CALSCALE:GREGORIAN\r\n"
+    "METHOD:PUBLISH\r\n"
+    "X-WR-TIMEZONE:Asia/Taipei\r\n"
+)
+ICS_FOOTER = "END:VCALENDAR\r\n"
+DTSTART_PREFIX = "DTSTART;TZID=Asia/Taipei:"
+DTEND_PREFIX = "DTEND;TZID=Asia/Taipei:"
+
+
+def iter_ics(events: List[dict], start_year: int, years: int, calendar_name: str = "農曆提醒") -> Iterator[str]:
+    # 依序產出檔頭、每一筆 VEVENT、檔尾，呼叫端可邊產生邊寫入
+    yield ICS_HEADER + fold_line(f"X-WR-CALNAME:{ics_escape(calendar_name)}") + "\r\n"
+
+    # 同一份檔案的 DTSTAMP 都是建立時間，算一次即可
+    dtstamp = dtstamp_utc()
+    seen_uid_keys: dict[str, int] = {}
+    for ev in events:
+        # 只跟事項有關的部分先組成整段 VEVENT 樣板，年份迴圈內只填入日期與起訖時間
+        uid_key = event_uid_key(ev)
+        dup = seen_uid_keys.get(uid_key, 0)
+        seen_uid_keys[uid_key] = dup + 1
+        if dup:
+            # 完全相同的事項重複出現時加上序號，維持檔案內 UID 唯一
+            uid_key = f"{uid_key}-{dup}"
+        esc_title = ics_escape(ev["title"])
+        summary = brace_escape(fold_line("SUMMARY:" + esc_title))
+        vevent_tmpl = (
+            "BEGIN:VEVENT\r\n"
+            f"UID:{{ymd}}-{uid_key}@lunar-ics\r\n"
+            f"DTSTAMP:{dtstamp}\r\n"
+            f"{summary}\r\n"
+        )
+        if ev["notes"]:
+            description = brace_escape(fold_line("DESCRIPTION:" + ics_escape(ev["notes"])))
+            vevent_tmpl += f"{description}\r\n"
+        vevent_tmpl += DTSTART_PREFIX + "{start}\r\n" + DTEND_PREFIX + "{end}\r\n"
+        if ev["alarm_minutes_before"] is not None:
+            alarm_minutes = int(ev["alarm_minutes_before"])
+            alarm_description = brace_escape(fold_line("DESCRIPTION:" + esc_title))
+            vevent_tmpl += (
+                "BEGIN:VALARM\r\n"
+                "ACTION:DISPLAY\r\n"
+                f"{alarm_description}\r\n"
+                f"TRIGGER:-PT{alarm_minutes}M\r\n"
+                "END:VALARM\r\n"
+            )
+        vevent_tmpl += "END:VEVENT\r\n"
+        fill_vevent = vevent_tmpl.format
+
+        for ymd, start_s, end_s in event_occurrences(ev, start_year, years):
+            yield fill_vevent(ymd=ymd, start=start_s, end=end_s)
+
+    yield ICS_FOOTER
+
+
+def build_ics(events: List[dict], start_year: int, years: int, calendar_name: str = "農曆提醒") -> str:
+    buf = io.StringIO()
+    for chunk in iter_ics(events, start_year, years, calendar_name):
+        buf.write(chunk)
+    return buf.getvalue()
+
+
+def build_ics_bytes(events: List[dict], start_year: int, years: int, calendar_name: str = "農曆提醒") -> bytes:
+    # 逐段編碼成 UTF-8，不必先組出完整的 str 再整份 encode
+    buf = io.BytesIO()
+    for chunk in iter_ics(events, start_year, years, calendar_name):
+        buf.write(chunk.encode("utf-8"))
+    return buf.getvalue()